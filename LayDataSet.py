@@ -2,8 +2,8 @@
 """
 Dataset Builder (standalone)
 - Scans a base recordings/ directory for subfolders (labels)
-- For each WAV file in subfolders, applies simple VAD using librosa.effects.split
-  (based on top_db) to find non-silent intervals
+- For each WAV file in subfolders, applies simple VAD (frame RMS in dB against
+  top_db, same semantics as librosa.effects.split) to find non-silent intervals
 - Options let you choose to keep the longest interval, concatenate intervals, or skip
   files shorter than a minimum duration
 - Saves processed WAV files into dataset/<label>/ with 16 kHz, 16-bit PCM, mono
@@ -13,19 +13,21 @@ Dataset Builder (standalone)
 
 Dependencies:
     pip install numpy soundfile librosa sounddevice matplotlib
+    pip install soxr  # only needed for recordings not already at 16 kHz
 
 Usage:
     python dataset_builder.py
 """
 import os
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
 import numpy as np
 import soundfile as sf
-import sounddevice as sd
-import librosa
+from stream_audio import ClipPlayer
 
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -35,9 +37,128 @@ SAMPLE_RATE = 16000
 SUBTYPE = 'PCM_16'
 RECORDINGS_DIR = 'recordings'
 OUTPUT_DIR = 'dataset'
+MMAP_MIN_BYTES = 4 * 1024 * 1024  # memory-map WAVs larger than this for preview
+VAD_BATCH = 16  # files per worker task; their VAD runs as one 2-D computation
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+def _read_audio(path):
+    """Read `path` as mono float32 at SAMPLE_RATE (librosa only for non-WAV input)."""
+    try:
+        y, sr = sf.read(path, dtype='float32', always_2d=False)
+    except RuntimeError:
+        import librosa  # slow to import; only needed for non-WAV input
+        y, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+        return y
+    if y.ndim == 2:
+        y = y.mean(axis=1)
+    if sr != SAMPLE_RATE:
+        import soxr
+        y = soxr.resample(y, sr, SAMPLE_RATE)
+    return y
+
+def _wav_data_offset(path):
+    """Byte offset of the 'data' chunk in a RIFF/WAVE file, or None."""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+            return None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            size = int.from_bytes(chunk[4:], 'little')
+            if chunk[:4] == b'data':
+                return f.tell()
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+def _load_file_mmap(path):
+    """Like _read_audio, but converts 16 kHz mono PCM_16 WAVs straight from a memmap."""
+    info = sf.info(path)
+    if (info.format, info.subtype, info.channels, info.samplerate) != ('WAV', 'PCM_16', 1, SAMPLE_RATE):
+        return _read_audio(path)
+    offset = _wav_data_offset(path)
+    if offset is None:
+        return _read_audio(path)
+    arr = np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(info.frames,))
+    y = arr.astype(np.float32)
+    y *= 1.0/32768.0
+    return y
+
+def fast_split(y, top_db=25, frame_length=2048, hop_length=512):
+    """Non-silent (n, 2) sample intervals of `y`, like librosa.effects.split."""
+    db = _frame_db(y, frame_length, hop_length)
+    return _active_intervals(db > (db.max() - top_db), hop_length, len(y))
+
+def fast_split_batch(ys, top_db=25, frame_length=2048, hop_length=512):
+    """fast_split for a list of signals, framed and reduced as one 2-D array."""
+    Y = np.zeros((len(ys), max(len(y) for y in ys)), dtype=np.float32)
+    for i, y in enumerate(ys):
+        Y[i, :len(y)] = y
+    db = _frame_db(Y, frame_length, hop_length)
+    out = []
+    for i, y in enumerate(ys):
+        row = db[i, :len(y)//hop_length + 1]  # drop padding frames before thresholding
+        out.append(_active_intervals(row > (row.max() - top_db), hop_length, len(y)))
+    return out
+
+def _frame_db(y, frame_length, hop_length):
+    """Per-frame power in dB along the last axis (centred frames)."""
+    pad = frame_length // 2
+    yp = np.pad(y, [(0, 0)] * (y.ndim - 1) + [(pad, pad)])
+    frames = np.lib.stride_tricks.sliding_window_view(yp, frame_length, axis=-1)[..., ::hop_length, :]
+    power = np.einsum('...ij,...ij->...i', frames, frames) / frame_length
+    return 10 * np.log10(np.maximum(power, 1e-10))
+
+def _active_intervals(active, hop_length, n):
+    """Sample intervals of the runs of True in a 1-D frame mask."""
+    edges = np.flatnonzero(np.diff(active.astype(np.int8))) + 1
+    if active[0]:
+        edges = np.r_[0, edges]
+    if active[-1]:
+        edges = np.r_[edges, len(active)]
+    intervals = edges.reshape(-1, 2) * hop_length
+    return np.minimum(intervals, n)
+
+def _keep_intervals(y, intervals, method):
+    """Return the part of `y` kept by `method` ('longest' or 'concat')."""
+    iv = np.asarray(intervals)
+    if method == 'longest':
+        s, e = iv[np.argmax(iv[:,1] - iv[:,0])]
+        return y[s:e]
+    out = np.empty(int((iv[:,1] - iv[:,0]).sum()), dtype=y.dtype)
+    pos = 0
+    for s, e in iv:
+        out[pos:pos+e-s] = y[s:e]
+        pos += e - s
+    return out
+
+def _process_batch(srcs, dsts, top_db, min_dur, method):
+    """Trim and write a batch in a worker process; one (status, error) per source."""
+    results = [None] * len(srcs)
+    loaded, ys = [], []
+    for i, src in enumerate(srcs):
+        try:
+            ys.append(_read_audio(src))
+            loaded.append(i)
+        except Exception as e:
+            results[i] = ('error', e)
+    if ys:
+        for i, y, intervals in zip(loaded, ys, fast_split_batch(ys, top_db=top_db)):
+            if len(intervals) == 0:
+                results[i] = ('no activity', None)
+                continue
+            proc = _keep_intervals(y, intervals, method)
+            if len(proc)/SAMPLE_RATE < min_dur:
+                results[i] = ('too short', None)
+                continue
+            try:
+                sf.write(dsts[i], proc, SAMPLE_RATE, subtype=SUBTYPE)
+                results[i] = ('ok', None)
+            except Exception as e:
+                results[i] = ('error', e)
+    return results
+
 class DatasetBuilder(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -52,6 +173,14 @@ class DatasetBuilder(tk.Tk):
         self.current_y = None
         self.processed_y = None
         self.intervals = []
+        self._t_cache = None  # float32 time axis, sliced for every plot
+        self._env_t_cache = {}  # (width, step) -> float32 envelope time axis
+
+        # output device is opened on first play, so batch trimming works without one
+        self.player = ClipPlayer()
+        self.protocol('WM_DELETE_WINDOW', self._on_close)
+
+        self._jobs = []  # running label-processing threads; closing waits for them
 
         self._build_ui()
         self._refresh_label_list()
@@ -108,6 +237,10 @@ class DatasetBuilder(tk.Tk):
         self.ax_proc = fig.add_subplot(212)
         self.ax_orig.set_title('Original Waveform (with intervals)')
         self.ax_proc.set_title('Processed Waveform')
+        # persistent artists, updated in place by _update_chart
+        self.line_orig, = self.ax_orig.plot([], [], color='blue')
+        self.line_proc, = self.ax_proc.plot([], [], color='orange')
+        self._spans = []
         self.canvas = FigureCanvasTkAgg(fig, master=right)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, pady=6)
@@ -124,7 +257,7 @@ class DatasetBuilder(tk.Tk):
         self.lb_labels.delete(0, tk.END)
         if not os.path.exists(RECORDINGS_DIR):
             os.makedirs(RECORDINGS_DIR, exist_ok=True)
-        labels = [d for d in os.listdir(RECORDINGS_DIR) if os.path.isdir(os.path.join(RECORDINGS_DIR, d))]
+        labels = [e.name for e in os.scandir(RECORDINGS_DIR) if e.is_dir()]
         labels.sort()
         for l in labels:
             self.lb_labels.insert(tk.END, l)
@@ -144,7 +277,7 @@ class DatasetBuilder(tk.Tk):
             return
         label = self.lb_labels.get(sel[0])
         folder = os.path.join(RECORDINGS_DIR, label)
-        files = [f for f in os.listdir(folder) if f.lower().endswith('.wav')]
+        files = [e.name for e in os.scandir(folder) if e.is_file() and e.name.lower().endswith('.wav')]
         files.sort()
         for f in files:
             self.lb_files.insert(tk.END, f)
@@ -166,7 +299,10 @@ class DatasetBuilder(tk.Tk):
     def _load_file(self, path):
         self._log('Selected file:', path)
         try:
-            y, sr = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+            if os.path.getsize(path) > MMAP_MIN_BYTES:
+                y = _load_file_mmap(path)
+            else:
+                y = _read_audio(path)
             self.current_y = y
             self._prepare_processed(y)
             self._update_chart()
@@ -175,55 +311,88 @@ class DatasetBuilder(tk.Tk):
 
     def _prepare_processed(self, y):
         top_db = float(self.top_db.get())
-        self.intervals = librosa.effects.split(y, top_db=top_db)
+        self.intervals = fast_split(y, top_db=top_db)
         self._log('Intervals found:', len(self.intervals))
         if len(self.intervals) == 0:
             self.processed_y = np.array([])
             return
         method = self.method.get()
-        if method == 'longest':
-            lengths = [(end-start, start, end) for (start,end) in self.intervals]
-            lengths.sort(reverse=True)
-            _, s, e = lengths[0]
-            self.processed_y = y[s:e]
-        else:
-            parts = [y[s:e] for (s,e) in self.intervals]
-            self.processed_y = np.concatenate(parts)
+        self.processed_y = _keep_intervals(y, self.intervals, method)
         if len(self.processed_y) / SAMPLE_RATE < float(self.min_duration.get()):
             self._log('Processed shorter than min_duration, discarding')
             self.processed_y = np.array([])
         else:
             self._log('Processed length (s):', len(self.processed_y)/SAMPLE_RATE)
 
+    def _plot_data(self, y):
+        """Time axis and samples to plot; long signals become a per-pixel min/max envelope."""
+        width = self.canvas.get_tk_widget().winfo_width()
+        if width <= 1:  # not mapped yet
+            width = 1200
+        if len(y) <= 4*width:
+            if self._t_cache is None or len(self._t_cache) < len(y):
+                self._t_cache = np.arange(len(y), dtype=np.float32) * (1.0/SAMPLE_RATE)
+            return self._t_cache[:len(y)], y
+        step = len(y) // width
+        cols = y[:width*step].reshape(width, step)
+        env = np.stack([cols.min(axis=1), cols.max(axis=1)], axis=1).ravel()
+        t = self._env_t_cache.get((width, step))
+        if t is None:
+            if len(self._env_t_cache) > 16:
+                self._env_t_cache.clear()
+            t = np.repeat(np.arange(width, dtype=np.float32) * np.float32(step/SAMPLE_RATE), 2)
+            self._env_t_cache[(width, step)] = t
+        return t, env
+
     def _update_chart(self):
-        self.ax_orig.cla()
-        self.ax_proc.cla()
+        for span in self._spans:
+            span.remove()
+        self._spans = []
         if self.current_y is not None:
-            t = np.linspace(0, len(self.current_y)/SAMPLE_RATE, len(self.current_y))
-            self.ax_orig.plot(t, self.current_y, color='blue')
+            self.line_orig.set_data(*self._plot_data(self.current_y))
             # highlight intervals
             for (s,e) in self.intervals:
-                self.ax_orig.axvspan(s/SAMPLE_RATE, e/SAMPLE_RATE, color='green', alpha=0.3)
-            self.ax_orig.set_title('Original Waveform (with intervals)')
+                self._spans.append(self.ax_orig.axvspan(s/SAMPLE_RATE, e/SAMPLE_RATE, color='green', alpha=0.3))
+        else:
+            self.line_orig.set_data([], [])
         if self.processed_y is not None and len(self.processed_y) > 0:
-            t2 = np.linspace(0, len(self.processed_y)/SAMPLE_RATE, len(self.processed_y))
-            self.ax_proc.plot(t2, self.processed_y, color='orange')
-            self.ax_proc.set_title('Processed Waveform')
-        self.canvas.draw()
+            self.line_proc.set_data(*self._plot_data(self.processed_y))
+        else:
+            self.line_proc.set_data([], [])
+        for ax in (self.ax_orig, self.ax_proc):
+            ax.relim()
+            ax.autoscale_view()
+        self.canvas.draw_idle()
+
+    def _play(self, y):
+        try:
+            self.player.play(y, SAMPLE_RATE)
+            return True
+        except Exception as e:
+            self._log('Playback error:', e)
+            return False
+
+    def _on_close(self):
+        self._jobs = [t for t in self._jobs if t.is_alive()]
+        if self._jobs:
+            messagebox.showinfo('Info', 'Processing is still running, wait for it to finish')
+            return
+        self.player.close()
+        self.destroy()
 
     def play_original(self):
         if self.current_y is None:
             self._log('No original loaded')
             return
-        sd.play(self.current_y.astype(np.float32), SAMPLE_RATE)
-        self._log('Playing original')
+        if self._play(self.current_y):
+            self._log('Playing original')
 
     def play_processed(self):
         if self.processed_y is None or len(self.processed_y) == 0:
             self._log('No processed audio to play')
             return
-        sd.play(self.processed_y.astype(np.float32), SAMPLE_RATE)
-        self._log('Playing processed')
+        if self._play(self.processed_y):
+            self._log('Playing processed')
 
     def save_processed_single(self):
         if not self.current_file or self.processed_y is None or len(self.processed_y) == 0:
@@ -237,41 +406,53 @@ class DatasetBuilder(tk.Tk):
         out_dir = os.path.join(OUTPUT_DIR, label)
         os.makedirs(out_dir, exist_ok=True)
         out_path = os.path.join(out_dir, fname)
-        data_to_write = (self.processed_y * 32767).astype(np.int16)
-        sf.write(out_path, data_to_write, SAMPLE_RATE, subtype=SUBTYPE)
+        try:
+            sf.write(out_path, self.processed_y, SAMPLE_RATE, subtype=SUBTYPE)
+        except Exception as e:
+            self._log('Save error:', e)
+            return
         self._log('Saved processed to', out_path)
 
-    def _process_label(self, label):
+    def _new_pool(self):
+        # spawn, not fork: this process already runs Tk and PortAudio threads
+        return ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                   mp_context=multiprocessing.get_context('spawn'))
+
+    def _process_label(self, label, ex):
         folder = os.path.join(RECORDINGS_DIR, label)
         out_dir = os.path.join(OUTPUT_DIR, label)
         os.makedirs(out_dir, exist_ok=True)
-        files = [f for f in os.listdir(folder) if f.lower().endswith('.wav')]
+        files = [e.name for e in os.scandir(folder) if e.is_file() and e.name.lower().endswith('.wav')]
+        top_db = float(self.top_db.get())
+        min_dur = float(self.min_duration.get())
+        method = self.method.get()
         count = 0
-        for f in files:
-            src = os.path.join(folder, f)
+        workers = os.cpu_count() or 1
+        # small labels still get spread over every worker
+        size = max(1, min(VAD_BATCH, -(-len(files) // workers)))
+        futures = {}
+        for i in range(0, len(files), size):
+            batch = files[i:i+size]
+            srcs = [os.path.join(folder, f) for f in batch]
+            dsts = [os.path.join(out_dir, f) for f in batch]
+            futures[ex.submit(_process_batch, srcs, dsts, top_db, min_dur, method)] = batch
+        for fut in as_completed(futures):
+            batch = futures[fut]
             try:
-                y, sr = librosa.load(src, sr=SAMPLE_RATE, mono=True)
-                intervals = librosa.effects.split(y, top_db=float(self.top_db.get()))
-                if len(intervals) == 0:
-                    self._log('No activity:', src)
-                    continue
-                if self.method.get() == 'longest':
-                    lengths = [(end-start, start, end) for (start,end) in intervals]
-                    lengths.sort(reverse=True)
-                    _, s, e = lengths[0]
-                    proc = y[s:e]
-                else:
-                    parts = [y[s:e] for (s,e) in intervals]
-                    proc = np.concatenate(parts)
-                if len(proc)/SAMPLE_RATE < float(self.min_duration.get()):
-                    self._log('Too short, skip:', src)
-                    continue
-                out_path = os.path.join(out_dir, f)
-                sf.write(out_path, (proc*32767).astype(np.int16), SAMPLE_RATE, subtype=SUBTYPE)
-                count += 1
+                results = fut.result()
             except Exception as e:
-                self._log('Error processing', src, e)
-        self._log('Processed label', label, '->', count, 'files')
+                results = [('error', e)] * len(batch)
+            for f, (status, payload) in zip(batch, results):
+                src = os.path.join(folder, f)
+                if status == 'error':
+                    self.after(0, self._log, 'Error processing', src, payload)
+                elif status == 'no activity':
+                    self.after(0, self._log, 'No activity:', src)
+                elif status == 'too short':
+                    self.after(0, self._log, 'Too short, skip:', src)
+                else:
+                    count += 1
+        self.after(0, self._log, 'Processed label', label, '->', count, 'files')
 
     def _process_selected_label(self):
         sel = self.lb_labels.curselection()
@@ -279,19 +460,25 @@ class DatasetBuilder(tk.Tk):
             messagebox.showinfo('Info', 'Select a label first')
             return
         label = self.lb_labels.get(sel[0])
-        threading.Thread(target=self._process_label, args=(label,)).start()
+        self._start_job([label])
 
     def _process_all_labels(self):
-        labels = [d for d in os.listdir(RECORDINGS_DIR) if os.path.isdir(os.path.join(RECORDINGS_DIR, d))]
-        threading.Thread(target=self._process_all_worker, args=(labels,)).start()
+        labels = [e.name for e in os.scandir(RECORDINGS_DIR) if e.is_dir()]
+        self._start_job(labels)
+
+    def _start_job(self, labels):
+        t = threading.Thread(target=self._process_all_worker, args=(labels,))
+        self._jobs.append(t)
+        t.start()
 
     def _process_all_worker(self, labels):
         total = 0
-        for l in labels:
-            self._log('Start label', l)
-            self._process_label(l)
-            total += 1
-        self._log('Done processing', total, 'labels')
+        with self._new_pool() as ex:  # one pool for every label
+            for l in labels:
+                self.after(0, self._log, 'Start label', l)
+                self._process_label(l, ex)
+                total += 1
+        self.after(0, self._log, 'Done processing', total, 'labels')
 
 if __name__ == '__main__':
     app = DatasetBuilder()
@@ -20,6 +20,7 @@ from tkinter import ttk
 import numpy as np
 import sounddevice as sd
 import soundfile as sf
+from stream_audio import ClipPlayer
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
@@ -30,6 +31,7 @@ SUBTYPE = 'PCM_16'
 OUTPUT_DIR = 'recordings'
 FILENAME_TEMPLATE = '{label}_{num:04d}.wav'
 RECORD_SECONDS = 1.0  # default recording time
+SORT_PAT = re.compile(r'([^_]+)_(\d+)\.wav$', re.IGNORECASE)  # <label>_<num>.wav
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -41,6 +43,11 @@ class App(tk.Tk):
 
         self.last_file = None
         self.temp_data = None
+        self._num_pat_cache = {}  # label -> compiled '<label>_<num>.wav' pattern
+
+        # output device is opened on first play; a new clip replaces the one playing
+        self.player = ClipPlayer()
+        self.protocol('WM_DELETE_WINDOW', self._on_close)
 
         self._build_ui()
 
@@ -120,6 +127,39 @@ class App(tk.Tk):
         self.entry_duration.insert(0, str(RECORD_SECONDS))
         self.entry_duration.pack(side=tk.LEFT)
 
+    def _play(self, data, sr=SAMPLE_RATE):
+        try:
+            self.player.play(data, sr)
+            return True
+        except Exception as e:
+            self.status_label.config(text=f'Lỗi phát: {e}')
+            return False
+
+    def _on_close(self):
+        self.player.close()
+        self.destroy()
+
+    def _record_frames(self, n):
+        # the InputStream callback writes straight into a preallocated buffer
+        buf = np.empty((n, CHANNELS), dtype=np.int16)
+        pos = 0
+        done = threading.Event()
+
+        def callback(indata, frames, time, status):
+            nonlocal pos
+            k = min(frames, n - pos)
+            buf[pos:pos+k] = indata[:k]
+            pos += k
+            if pos >= n:
+                done.set()
+                raise sd.CallbackStop
+
+        with sd.InputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, dtype='int16', callback=callback):
+            # give up if the device stops delivering blocks instead of hanging the record thread
+            if not done.wait(n / SAMPLE_RATE + 1.0):
+                raise RuntimeError('recording timed out')
+        return buf
+
     def on_record(self):
         def task():
             try:
@@ -128,13 +168,12 @@ class App(tk.Tk):
                 except ValueError:
                     duration = RECORD_SECONDS
                 self.status_label.config(text=f'Đang ghi {duration:.1f} giây...')
-                data = sd.rec(int(duration*SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=CHANNELS, dtype='int16')
-                sd.wait()
+                data = self._record_frames(int(duration*SAMPLE_RATE))
                 self.temp_data = data[:,0]
                 self._plot_waveform(self.temp_data)
                 # Play back for confirmation
                 self.status_label.config(text='Phát lại để kiểm tra...')
-                sd.play(self.temp_data.astype(np.float32) / 32768.0, SAMPLE_RATE)
+                self._play(self.temp_data.astype(np.float32) * (1.0/32768.0))
                 self.btn_record.config(text=f'Record {duration:.1f}s')
             except Exception as e:
                 self.status_label.config(text=f'Lỗi: {e}')
@@ -158,10 +197,13 @@ class App(tk.Tk):
         self.status_label.config(text=f'Đã lưu: {filepath}')
 
     def _next_number_for_label(self, label):
-        pat = re.compile(re.escape(label) + r'_(\d+)\.wav$', re.IGNORECASE)
+        pat = self._num_pat_cache.get(label)
+        if pat is None:
+            pat = re.compile(re.escape(label) + r'_(\d+)\.wav$', re.IGNORECASE)
+            self._num_pat_cache[label] = pat
         nums = []
-        for f in os.listdir(OUTPUT_DIR):
-            m = pat.search(f)
+        for e in os.scandir(OUTPUT_DIR):
+            m = pat.search(e.name)
             if m:
                 try:
                     nums.append(int(m.group(1)))
@@ -183,10 +225,9 @@ class App(tk.Tk):
         if not filepath or not os.path.exists(filepath):
             self.status_label.config(text='Chưa có file để phát.')
             return
-        data, sr = sf.read(filepath, dtype='int16')
-        data_out = data.astype(np.float32) / 32768.0
-        sd.play(data_out, sr)
-        self.status_label.config(text=f'Đang phát: {os.path.basename(filepath)}')
+        data, sr = sf.read(filepath, dtype='float32')
+        if self._play(data[:,0] if data.ndim==2 else data, sr):
+            self.status_label.config(text=f'Đang phát: {os.path.basename(filepath)}')
 
     def on_list_double(self, event):
         sel_idx = self.listbox_files.curselection()
@@ -202,24 +243,30 @@ class App(tk.Tk):
             self.status_label.config(text=f'Đã chọn: {filepath}')
 
     def _refresh_lists(self):
+        # one pass over recordings/ for both lists
+        files, labels = [], []
+        with os.scandir(OUTPUT_DIR) as it:
+            for e in it:
+                if e.is_dir():
+                    labels.append(e.name)
+                elif e.is_file() and e.name.lower().endswith('.wav'):
+                    files.append(e.name)
         # update files
         self.listbox_files.delete(0, tk.END)
-        files = [f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith('.wav')]
         files.sort()
         for f in files:
             self.listbox_files.insert(tk.END, f)
         # update labels (folders)
         self.listbox_labels.delete(0, tk.END)
-        labels = [d for d in os.listdir(OUTPUT_DIR) if os.path.isdir(os.path.join(OUTPUT_DIR, d))]
         labels.sort()
         for l in labels:
             self.listbox_labels.insert(tk.END, l)
 
     def on_sort(self):
-        files = [f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith('.wav')]
+        files = [e.name for e in os.scandir(OUTPUT_DIR) if e.is_file()]
         moved = 0
         for f in files:
-            m = re.match(r'([^_]+)_(\d+)\.wav$', f, re.IGNORECASE)
+            m = SORT_PAT.match(f)
             if m:
                 label = m.group(1)
                 src = os.path.join(OUTPUT_DIR, f)
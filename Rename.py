@@ -8,6 +8,34 @@ def select_folder():
     if folder_path.get():
         lbl_folder.config(text=folder_path.get())
 
+def link_or_copy(src, dst):
+    # Hardlink: không copy dữ liệu; khác ổ đĩa / không có quyền thì copy nội dung
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # chạy lại lần 2: đã là hardlink thì bỏ qua, file cũ thì thay bằng link mới
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+        link_or_copy(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def rename_tree(src_dir, dst_dir):
+    os.makedirs(dst_dir, exist_ok=True)
+    with os.scandir(src_dir) as it:
+        entries = list(it)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            rename_tree(entry.path, os.path.join(dst_dir, entry.name))
+        elif entry.name.endswith(".wav") and "_" in entry.name:
+            parts = entry.name.rsplit("_", 1)
+            if len(parts) == 2:
+                name, num_ext = parts
+                num, ext = os.path.splitext(num_ext)
+                new_name = f"{name}.{num}{ext}"
+                link_or_copy(entry.path, os.path.join(dst_dir, new_name))
+
 def rename_files():
     src_folder = folder_path.get()
     if not src_folder:
@@ -22,19 +50,7 @@ def rename_files():
         os.makedirs(dst_folder)
 
     # Duyệt các subfolder
-    for subdir, dirs, files in os.walk(src_folder):
-        rel_path = os.path.relpath(subdir, src_folder)
-        new_subdir = os.path.join(dst_folder, rel_path)
-        os.makedirs(new_subdir, exist_ok=True)
-
-        for file in files:
-            if file.endswith(".wav") and "_" in file:
-                parts = file.rsplit("_", 1)
-                if len(parts) == 2:
-                    name, num_ext = parts
-                    num, ext = os.path.splitext(num_ext)
-                    new_name = f"{name}.{num}{ext}"
-                    shutil.copy2(os.path.join(subdir, file), os.path.join(new_subdir, new_name))
+    rename_tree(src_folder, dst_folder)
 
     messagebox.showinfo("Success", f"Renaming done! Files saved in:\n{dst_folder}")
 
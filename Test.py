@@ -2,11 +2,11 @@ import tkinter as tk
 from tkinter import filedialog
 import sounddevice as sd
 import numpy as np
-import librosa
 import soundfile as sf
-import tensorflow as tf
 import os
 
+# librosa / numba / tensorflow import chậm -> import lúc dùng lần đầu
+
 # ==== CONFIG ====
 DURATION = 2       # 2 giây ghi âm
 SR = 16000         # sample rate
@@ -31,14 +31,30 @@ label_room   = ["Ngu", "Khach", "Bep"]
 # ==== GLOBAL ====
 model = None
 model_input_shape = None   # (batch, h, w, c)
+infer = None               # concrete function của model (không qua model.predict)
+
+# MFCC giống librosa.feature.mfcc mặc định
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+_mfcc_cache = {}   # (sr, n_mfcc) -> (Hann window, mel filterbank, DCT matrix)
+_fit_frames = None # bản numba.njit của _fit_frames_py, compile lần đầu dùng
 
 # ==== FUNCTIONS ====
 def load_model_file():
-    global model, model_input_shape
+    global model, model_input_shape, infer
     path = filedialog.askopenfilename(filetypes=[("Model H5", "*.h5")])
     if path:
+        import tensorflow as tf
         model = tf.keras.models.load_model(path)
         model_input_shape = model.input_shape  # vd: (None, 40, 64, 1)
+        # trace 1 lần với input cố định -> predict không retrace mỗi lần bấm
+        try:
+            infer = tf.function(lambda x: model(x, training=False)).get_concrete_function(
+                tf.TensorSpec(model_input_shape, tf.float32))
+        except (TypeError, ValueError):
+            # model không trace được với input_shape -> gọi thẳng model(), vẫn không qua predict()
+            infer = lambda x: model(x, training=False)
         status_label.config(text=f"✅ Loaded model: {os.path.basename(path)} | input: {model_input_shape}")
 
 def record_audio():
@@ -57,8 +73,30 @@ def play_audio():
     else:
         status_label.config(text="⚠ Chưa có file ghi âm")
 
+def _mfcc_matrices(sr, n_mfcc):
+    """Hann window + mel filterbank + DCT-II, tạo một lần cho mỗi (sr, n_mfcc)"""
+    key = (sr, n_mfcc)
+    if key not in _mfcc_cache:
+        import librosa
+        import scipy.fft
+        import scipy.signal
+        win = scipy.signal.get_window("hann", N_FFT, fftbins=True).astype(np.float32)  # như librosa.stft
+        mel_fb = librosa.filters.mel(sr=sr, n_fft=N_FFT, n_mels=N_MELS)
+        dct = scipy.fft.dct(np.eye(N_MELS), type=2, norm="ortho", axis=0)[:n_mfcc].astype(np.float32)
+        _mfcc_cache[key] = (win, mel_fb.T.copy(), dct)
+    return _mfcc_cache[key]
+
+def _fit_frames_py(feat, time_steps):
+    """Pad 0 / cắt theo trục thời gian cho đủ time_steps"""
+    out = np.zeros((feat.shape[0], time_steps), dtype=feat.dtype)
+    w = min(feat.shape[1], time_steps)
+    out[:, :w] = feat[:, :w]
+    return out
+
 def extract_features(file_path):
     """Chuẩn MFCC theo input_shape của model"""
+    global _fit_frames
+    import librosa
     y, sr = librosa.load(file_path, sr=SR)
 
     if model_input_shape is None:
@@ -69,12 +107,19 @@ def extract_features(file_path):
     time_steps = target_shape[1]
     channels = target_shape[2] if len(target_shape) == 3 else 1
 
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc)
-
-    if mfcc.shape[1] < time_steps:
-        mfcc = np.pad(mfcc, ((0,0),(0,time_steps-mfcc.shape[1])), mode="constant")
-    else:
-        mfcc = mfcc[:,:time_steps]
+    win, mel_fb_t, dct = _mfcc_matrices(sr, n_mfcc)
+    if _fit_frames is None:
+        import numba
+        _fit_frames = numba.njit(cache=True)(_fit_frames_py)
+    # STFT center=True (pad 0 hai đầu) giống librosa.stft
+    import scipy.fft
+    yp = np.pad(y, (N_FFT // 2, N_FFT // 2))
+    frames = np.lib.stride_tricks.sliding_window_view(yp, N_FFT)[::HOP_LENGTH]
+    spec = scipy.fft.rfft(frames * win, axis=1)
+    power = spec.real**2 + spec.imag**2                 # (frames, 1 + N_FFT/2)
+    logmel = 10.0 * np.log10(np.maximum(power @ mel_fb_t, 1e-10))
+    logmel = np.maximum(logmel, logmel.max() - 80.0)   # như librosa.power_to_db(top_db=80)
+    mfcc = _fit_frames(dct @ logmel.T, time_steps)
 
     if len(target_shape) == 3:
         mfcc = mfcc.reshape((n_mfcc, time_steps, channels))
@@ -95,13 +140,14 @@ def predict_audio():
         feat = extract_features(TEMP_FILE)
         X = np.expand_dims(feat, axis=0)
 
-        preds = model.predict(X)
+        import tensorflow as tf
+        preds = infer(tf.constant(X, dtype=tf.float32))
 
         # Nếu output softmax 1 nhánh (n class)
-        if isinstance(preds, list):
-            preds = preds[0]  # lấy nhánh chính nếu có nhiều
+        if isinstance(preds, (list, tuple)):
+            preds = preds[0].numpy()  # lấy nhánh chính nếu có nhiều
         else:
-            preds = preds[0]
+            preds = preds.numpy()[0]
 
         idx = np.argmax(preds)
         confidence = preds[idx]
@@ -1,29 +1,43 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
+from concurrent.futures import ThreadPoolExecutor
 import librosa
+import numpy as np
 import soundfile as sf
 
+def _voiced_intervals(y, top_db, frame_length, hop_length):
+    # = librosa.effects.split: frame có RMS trên (max - top_db) dB là có tiếng
+    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+    voiced = rms > rms.max() * 10 ** (-top_db / 20)
+    edges = np.flatnonzero(np.diff(voiced.astype(np.int8))) + 1
+    if voiced[0]:
+        edges = np.r_[0, edges]
+    if voiced[-1]:
+        edges = np.r_[edges, len(voiced)]
+    return np.minimum(edges * hop_length, len(y)).reshape(-1, 2)
+
 def split_words(file_path, out_dir="splitted_words"):
-    y, sr = librosa.load(file_path, sr=None)
+    # soundfile đọc thẳng wav, không qua audioread của librosa.load
+    y, sr = sf.read(file_path, dtype="float32", always_2d=False)
+    if y.ndim == 2:
+        y = y.mean(axis=1)
 
     # Cắt theo khoảng lặng, cho nhạy hơn để tách từng từ
-    intervals = librosa.effects.split(y, top_db=40, frame_length=512, hop_length=128)
+    intervals = _voiced_intervals(y, top_db=40, frame_length=512, hop_length=128)
 
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    files = []
-    for i, (start, end) in enumerate(intervals):
-        segment = y[start:end]
+    # bỏ noise ngắn <0.15s trước vòng lặp, chỉ ghi các đoạn giữ lại
+    keep = np.flatnonzero(intervals[:, 1] - intervals[:, 0] >= sr * 0.15)
 
-        # bỏ noise ngắn <0.15s
-        if (end - start) < sr * 0.15:
-            continue
+    files = [os.path.join(out_dir, f"word_{i+1}.wav") for i in keep]
+    segments = [y[start:end] for start, end in intervals[keep]]
 
-        out_file = os.path.join(out_dir, f"word_{i+1}.wav")
-        sf.write(out_file, segment, sr)
-        files.append(out_file)
+    # libsndfile nhả GIL khi encode/ghi -> ghi các đoạn song song
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        list(ex.map(lambda f, seg: sf.write(f, seg, sr), files, segments))
 
     return files
 
@@ -2,13 +2,15 @@
 import tkinter as tk
 from tkinter import ttk
 import sounddevice as sd
-import soundfile as sf
-import os
+from stream_audio import StreamAudioMixin
 
 SAMPLE_RATE = 16000
 RECORD_FILE = "temp_record.wav"
 
-class MicTestGUI(tk.Tk):
+class MicTestGUI(StreamAudioMixin, tk.Tk):
+    record_file = RECORD_FILE
+    sample_rate = SAMPLE_RATE
+
     def __init__(self):
         super().__init__()
         self.title("Microphone Test")
@@ -32,26 +34,6 @@ class MicTestGUI(tk.Tk):
         status_frame.pack(fill=tk.X, padx=10, pady=20)
         ttk.Label(status_frame, textvariable=self.status_var, foreground="blue").pack(side=tk.LEFT)
 
-    def _record(self):
-        duration = 2  # seconds
-        self._update_status(f"Recording for {duration} seconds...")
-        self.update_idletasks()
-        recording = sd.rec(int(duration*SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1)
-        sd.wait()
-        sf.write(RECORD_FILE, recording, SAMPLE_RATE)
-        self._update_status(f"Recording saved to {RECORD_FILE}")
-
-    def _play(self):
-        if not os.path.exists(RECORD_FILE):
-            self._update_status("No recording found")
-            return
-        data, sr = sf.read(RECORD_FILE)
-        self._update_status("Playing recording...")
-        self.update_idletasks()
-        sd.play(data, sr)
-        sd.wait()
-        self._update_status("Playback finished")
-
     def _mic_info(self):
         try:
             default_input = sd.default.device[0]
@@ -0,0 +1,33 @@
+"""Đọc wav + STFT/Mel dùng chung cho train_ver3.py và test_ver*.py (không import TF)"""
+import numpy as np
+import librosa
+import scipy.fft
+import soundfile as sf
+
+SAMPLE_RATE = 16000
+N_MELS = 40
+N_FFT = 2048       # n_fft mặc định của librosa.feature.melspectrogram
+HOP_LENGTH = 512   # hop mặc định của librosa.feature.melspectrogram
+
+# Mel filterbank + cửa sổ hann dựng một lần mỗi process (melspectrogram dựng lại mỗi lần gọi)
+MEL_FB = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS, fmin=20, fmax=4000)
+WIN = librosa.filters.get_window("hann", N_FFT, fftbins=True).astype(np.float32)
+
+def read_wav(path):
+    """Đọc wav mono float32 ở SAMPLE_RATE (soundfile, không qua audioread)"""
+    y, sr = sf.read(path, dtype="float32", always_2d=False)
+    if y.ndim == 2:
+        y = y.mean(axis=1)
+    if sr != SAMPLE_RATE:
+        y = librosa.resample(y, orig_sr=sr, target_sr=SAMPLE_RATE, res_type="soxr_hq")
+    return y
+
+def stft_power(y):
+    """|STFT|^2 như librosa.stft(center=True), shape (..., 1 + N_FFT/2, frames)"""
+    pad = [(0, 0)] * (y.ndim - 1) + [(N_FFT // 2, N_FFT // 2)]
+    # frame bằng view (không copy), rfft đa luồng trên cả khối
+    frames = np.lib.stride_tricks.sliding_window_view(np.pad(y, pad), N_FFT, axis=-1)
+    frames = frames[..., ::HOP_LENGTH, :] * WIN
+    spec = scipy.fft.rfft(frames, axis=-1, workers=-1, overwrite_x=True)
+    power = spec.real**2 + spec.imag**2
+    return power.swapaxes(-1, -2)
@@ -0,0 +1,110 @@
+"""Load model (.h5 / SavedModel / .tflite) và chạy predict, dùng chung cho test_ver2.py và test_ver3.py"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import filedialog
+
+import numpy as np
+import tensorflow as tf
+
+class ModelRunnerMixin:
+    """Một model cho mỗi nhóm nhãn; lớp dùng gọi _init_models(groups) và có result_vars, _update_status."""
+
+    def _init_models(self, groups):
+        self.label_groups = list(groups)
+        self.models = {name: None for name in self.label_groups}
+        self.label_maps = {name: {} for name in self.label_groups}
+        # các model Keras gộp vào một tf.function (XLA), dựng lại mỗi lần load model
+        self._fused = None
+        self._fused_groups = []
+        # object từ tf.saved_model.load, giữ lại để signature của nó không bị giải phóng
+        self._saved = {}
+
+    def _load_model(self, group_name):
+        path = filedialog.askopenfilename(filetypes=[("Model files","*.h5 *.tflite saved_model.pb"), ("H5 files","*.h5"), ("TFLite files","*.tflite"), ("SavedModel","saved_model.pb")])
+        if not path:
+            self._update_status(f"Load model canceled for {group_name}")
+            return
+        saved = None  # chỉ thay self._saved khi load xong
+        loaded_from = path
+        try:
+            if path.lower().endswith(".tflite"):
+                # TFLite (từ train_ver3): chạy bằng Interpreter, không qua Keras
+                model = tf.lite.Interpreter(model_path=path, num_threads=os.cpu_count())
+                model.allocate_tensors()
+            else:
+                # SavedModel (train_ver3 lưu cạnh .h5): chỉ graph inference, không optimizer/layer Python
+                if os.path.basename(path) == "saved_model.pb":
+                    path = os.path.dirname(path)
+                saved_dir = os.path.splitext(path)[0] if path.lower().endswith(".h5") else path
+                saved_pb = os.path.join(saved_dir, "saved_model.pb")
+                # Save Model ghi đè .h5 mà không cập nhật thư mục -> thư mục cũ hơn thì dùng .h5
+                if os.path.exists(saved_pb) and (saved_dir == path or os.path.getmtime(saved_pb) >= os.path.getmtime(path)):
+                    saved = tf.saved_model.load(saved_dir)
+                    model = saved.signatures["serving_default"]
+                    loaded_from = saved_dir
+                else:
+                    model = tf.keras.models.load_model(path)
+            self.models[group_name] = model
+            if saved is not None:
+                self._saved[group_name] = saved
+            else:
+                self._saved.pop(group_name, None)
+            self._build_fused()
+            # load label map
+            label_file = path + "_labels.json"
+            if os.path.exists(label_file):
+                with open(label_file, "r") as f:
+                    self.label_maps[group_name] = json.load(f)
+            self._update_status(f"{group_name} model loaded: {os.path.basename(loaded_from)}")
+        except Exception as e:
+            self._update_status(f"Error loading {group_name} model: {e}")
+
+    def _show_predictions(self, x):
+        """Chạy mọi model đã load trên input x (1,40,64,1), ghi nhãn vào result_vars"""
+        keras_preds = self._predict_keras(x)
+        for group in self.label_groups:
+            model = self.models[group]
+            if model is None:
+                self.result_vars[group].set("No model loaded")
+                continue
+            pred = keras_preds[group] if group in keras_preds else self._run_model(model, np.asarray(x))
+            idx = np.argmax(pred)
+            label = self.label_maps[group].get(str(idx), f"Label {idx}")
+            self.result_vars[group].set(label)
+
+    def _run_model(self, model, x):
+        if isinstance(model, tf.lite.Interpreter):
+            inp = model.get_input_details()[0]
+            out = model.get_output_details()[0]
+            if inp["dtype"] == np.int8:
+                scale, zero_point = inp["quantization"]
+                x = np.clip(np.round(x / scale + zero_point), -128, 127)
+            model.set_tensor(inp["index"], x.astype(inp["dtype"]))
+            model.invoke()
+            return model.get_tensor(out["index"])  # argmax không cần dequantize
+        if not isinstance(model, tf.keras.Model):
+            # signature serving_default: gọi bằng keyword, trả về dict
+            name = next(iter(model.structured_input_signature[1]))
+            return next(iter(model(**{name: tf.constant(x, dtype=tf.float32)}).values())).numpy()
+        return model(x, training=False).numpy()
+
+    def _build_fused(self):
+        self._fused_groups = [g for g in self.label_groups if isinstance(self.models[g], tf.keras.Model)]
+        models = [self.models[g] for g in self._fused_groups]
+        self._fused = tf.function(lambda x: [m(x, training=False) for m in models], jit_compile=True) if models else None
+
+    def _predict_keras(self, x):
+        """Chạy mọi model Keras đã load trên cùng input -> {group: pred}"""
+        if not self._fused_groups:
+            return {}
+        x = tf.constant(x, dtype=tf.float32)
+        if self._fused is not None:
+            try:
+                outs = self._fused(x)
+                return {g: o.numpy() for g, o in zip(self._fused_groups, outs)}
+            except Exception:
+                self._fused = None  # XLA không dùng được -> chạy song song từng model
+        with ThreadPoolExecutor(max_workers=len(self._fused_groups)) as ex:
+            futures = {g: ex.submit(self._run_model, self.models[g], x) for g in self._fused_groups}
+        return {g: f.result() for g, f in futures.items()}
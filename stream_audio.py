@@ -0,0 +1,141 @@
+"""Ghi âm / phát lại không chặn Tk mainloop, dùng chung cho abc.py và test_ver*.py"""
+import os
+import threading
+import time
+
+import numpy as np
+import sounddevice as sd
+import soundfile as sf
+
+BLOCKSIZE = 1024
+POLL_MS = 50
+TIMEOUT_S = 1.0  # chờ thêm sau độ dài dự kiến trước khi coi device bị treo
+
+class ClipPlayer:
+    """Phát clip mono qua một OutputStream, mở lần đầu phát; clip mới thay clip đang phát (như sd.play)"""
+
+    def __init__(self):
+        self._stream = None
+        self._clip = [np.zeros(0, dtype=np.float32), 0]  # [samples, vị trí]
+        self._lock = threading.Lock()  # play có thể được gọi từ thread khác
+
+    def play(self, data, sr):
+        """Phát data ở sample rate sr; lỗi device ném ra cho nơi gọi báo lên GUI"""
+        with self._lock:
+            if self._stream is not None and self._stream.samplerate != sr:
+                self._close()
+            if self._stream is None:
+                self._stream = sd.OutputStream(samplerate=sr, channels=1, dtype='float32',
+                                               blocksize=BLOCKSIZE, callback=self._cb)
+            # abort chờ callback dừng hẳn rồi mới đổi clip; stream chỉ chạy khi đang phát
+            self._stream.abort()
+            self._clip = [np.ascontiguousarray(data, dtype=np.float32).ravel(), 0]
+            self._stream.start()
+
+    def _cb(self, outdata, frames, time_info, status):
+        clip = self._clip
+        data, pos = clip
+        n = max(0, min(frames, len(data) - pos))
+        outdata[:n, 0] = data[pos:pos+n]
+        outdata[n:] = 0
+        clip[1] = pos + n
+        if n < frames:
+            raise sd.CallbackStop
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.abort()
+                stream.close()
+            except Exception:
+                pass
+
+class StreamAudioMixin:
+    """_record / _play không chặn cho tk.Tk; lớp dùng đặt record_file, sample_rate, có _update_status"""
+    record_file = "temp_record.wav"
+    sample_rate = 16000
+    record_seconds = 2
+    _stream = None  # InputStream/OutputStream đang chạy (record/play)
+
+    def _record(self):
+        if self._stream is not None:
+            self._update_status("Audio device busy")
+            return
+        duration = self.record_seconds
+        # callback ghi vào buffer cấp sẵn
+        self._buf = np.zeros((duration*self.sample_rate, 1), dtype=np.float32)
+        self._pos = 0
+        if self._start_stream(sd.InputStream, self.sample_rate, 1, self._record_cb, duration, self._record_done):
+            self._update_status(f"Recording for {duration} seconds...")
+
+    def _record_cb(self, indata, frames, time_info, status):
+        n = min(frames, len(self._buf) - self._pos)
+        self._buf[self._pos:self._pos+n] = indata[:n]
+        self._pos += n
+        if self._pos >= len(self._buf):
+            raise sd.CallbackStop
+
+    def _record_done(self):
+        sf.write(self.record_file, self._buf, self.sample_rate)
+        self._update_status(f"Recording saved to {self.record_file}")
+
+    def _play(self):
+        if not os.path.exists(self.record_file):
+            self._update_status("No recording found")
+            return
+        if self._stream is not None:
+            self._update_status("Audio device busy")
+            return
+        data, sr = sf.read(self.record_file, dtype='float32', always_2d=True)
+        self._buf = data
+        self._pos = 0
+        if self._start_stream(sd.OutputStream, sr, data.shape[1], self._play_cb, len(data) / sr,
+                              lambda: self._update_status("Playback finished")):
+            self._update_status("Playing recording...")
+
+    def _play_cb(self, outdata, frames, time_info, status):
+        n = min(frames, len(self._buf) - self._pos)
+        outdata[:n] = self._buf[self._pos:self._pos+n]
+        outdata[n:] = 0
+        self._pos += n
+        if n < frames:
+            raise sd.CallbackStop
+
+    def _start_stream(self, stream_cls, sr, channels, callback, seconds, on_done):
+        try:
+            self._stream = stream_cls(samplerate=sr, channels=channels, dtype='float32',
+                                      blocksize=BLOCKSIZE, callback=callback)
+            self._stream.start()
+        except Exception as e:
+            self._close_stream()
+            self._update_status(f"Audio device error: {e}")
+            return False
+        deadline = time.monotonic() + seconds + TIMEOUT_S
+        self.after(POLL_MS, self._poll_stream, on_done, deadline)
+        return True
+
+    def _poll_stream(self, on_done, deadline):
+        if self._stream.active:
+            if time.monotonic() < deadline:
+                self.after(POLL_MS, self._poll_stream, on_done, deadline)
+                return
+            # device ngừng gọi callback: dừng hẳn, không để _stream kẹt ở trạng thái busy
+            self._close_stream()
+            self._update_status("Audio device timed out")
+            return
+        self._close_stream()
+        on_done()
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.abort()
+                stream.close()
+            except Exception:
+                pass
@@ -4,8 +4,7 @@ import tkinter as tk
 from tkinter import filedialog, ttk
 
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
+from stream_audio import StreamAudioMixin
 import librosa
 import tensorflow as tf
 
@@ -17,7 +16,10 @@ RECORD_FILE = "temp_record.wav"
 
 LABEL_GROUPS = ["Action", "Device", "Room"]
 
-class VoiceTestGUI(tk.Tk):
+class VoiceTestGUI(StreamAudioMixin, tk.Tk):
+    record_file = RECORD_FILE
+    sample_rate = SAMPLE_RATE
+
     def __init__(self):
         super().__init__()
         self.title("Voice Test")
@@ -54,26 +56,6 @@ class VoiceTestGUI(tk.Tk):
         status_frame.pack(fill=tk.X, padx=10, pady=10)
         ttk.Label(status_frame, textvariable=self.status_var, foreground="blue").pack(side=tk.LEFT)
 
-    def _record(self):
-        duration = 2  # seconds
-        self._update_status(f"Recording for {duration} seconds...")
-        self.update_idletasks()
-        recording = sd.rec(int(duration*SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1)
-        sd.wait()
-        sf.write(RECORD_FILE, recording, SAMPLE_RATE)
-        self._update_status(f"Recording saved to {RECORD_FILE}")
-
-    def _play(self):
-        if not os.path.exists(RECORD_FILE):
-            self._update_status("No recording found")
-            return
-        data, sr = sf.read(RECORD_FILE)
-        self._update_status("Playing recording...")
-        self.update_idletasks()
-        sd.play(data, sr)
-        sd.wait()
-        self._update_status("Playback finished")
-
     def _load_model(self, group_name):
         path = filedialog.askopenfilename(filetypes=[("H5 files","*.h5")])
         if not path:
@@ -93,6 +75,10 @@ class VoiceTestGUI(tk.Tk):
             self._update_status(f"Error loading {group_name} model: {e}")
 
     def _predict(self):
+        if self._stream is not None:
+            # đang ghi/phát: temp_record.wav vẫn là bản ghi cũ
+            self._update_status("Audio device busy")
+            return
         if not os.path.exists(RECORD_FILE):
             self._update_status("No recording to predict")
             return
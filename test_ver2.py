@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 import os
 import tkinter as tk
-from tkinter import filedialog, ttk
+from tkinter import ttk
 
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
 import librosa
-import tensorflow as tf
+import scipy.fft
+from audio_features import N_FFT, read_wav, stft_power
+from model_runner import ModelRunnerMixin
+from stream_audio import StreamAudioMixin
 
 SAMPLE_RATE = 16000
 N_MFCC = 40
@@ -17,18 +18,27 @@ RECORD_FILE = "temp_record.wav"
 
 LABEL_GROUPS = ["Action", "Device", "Room"]
 
-class VoiceTestGUI(tk.Tk):
+# mel 128 băng (mặc định của librosa.feature.mfcc) + DCT-II, dựng một lần thay vì mỗi lần predict
+_MFCC_MEL_FB = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=128, fmax=4000)
+_DCT = scipy.fft.dct(np.eye(128, dtype=np.float32), type=2, norm="ortho", axis=0)[:N_MFCC]
+
+class VoiceTestGUI(StreamAudioMixin, ModelRunnerMixin, tk.Tk):
+    record_file = RECORD_FILE
+    sample_rate = SAMPLE_RATE
+
     def __init__(self):
         super().__init__()
         self.title("Voice Test")
         self.geometry("600x450")
 
-        self.models = {name: None for name in LABEL_GROUPS}
-        self.label_maps = {name: {} for name in LABEL_GROUPS}
+        self._init_models(LABEL_GROUPS)
         self.result_vars = {name: tk.StringVar(value="") for name in LABEL_GROUPS}
 
         self.status_var = tk.StringVar(value="Ready")
 
+        # input (1,40,64,1) dùng lại giữa các lần predict
+        self._mfcc_buf = np.zeros((1, N_MFCC, MAX_LEN, CHANNELS), dtype=np.float32)
+
         self._build_ui()
 
     def _build_ui(self):
@@ -54,45 +64,11 @@ class VoiceTestGUI(tk.Tk):
         status_frame.pack(fill=tk.X, padx=10, pady=10)
         ttk.Label(status_frame, textvariable=self.status_var, foreground="blue").pack(side=tk.LEFT)
 
-    def _record(self):
-        duration = 2  # seconds
-        self._update_status(f"Recording for {duration} seconds...")
-        self.update_idletasks()
-        recording = sd.rec(int(duration*SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1)
-        sd.wait()
-        sf.write(RECORD_FILE, recording, SAMPLE_RATE)
-        self._update_status(f"Recording saved to {RECORD_FILE}")
-
-    def _play(self):
-        if not os.path.exists(RECORD_FILE):
-            self._update_status("No recording found")
-            return
-        data, sr = sf.read(RECORD_FILE)
-        self._update_status("Playing recording...")
-        self.update_idletasks()
-        sd.play(data, sr)
-        sd.wait()
-        self._update_status("Playback finished")
-
-    def _load_model(self, group_name):
-        path = filedialog.askopenfilename(filetypes=[("H5 files","*.h5")])
-        if not path:
-            self._update_status(f"Load model canceled for {group_name}")
-            return
-        try:
-            model = tf.keras.models.load_model(path)
-            self.models[group_name] = model
-            # load label map
-            label_file = path + "_labels.json"
-            if os.path.exists(label_file):
-                import json
-                with open(label_file, "r") as f:
-                    self.label_maps[group_name] = json.load(f)
-            self._update_status(f"{group_name} model loaded: {os.path.basename(path)}")
-        except Exception as e:
-            self._update_status(f"Error loading {group_name} model: {e}")
-
     def _predict(self):
+        if self._stream is not None:
+            # đang ghi/phát: temp_record.wav vẫn là bản ghi cũ
+            self._update_status("Audio device busy")
+            return
         if not os.path.exists(RECORD_FILE):
             self._update_status("No recording to predict")
             return
@@ -101,24 +77,18 @@ class VoiceTestGUI(tk.Tk):
         for group in LABEL_GROUPS:
             self.result_vars[group].set("")
 
-        y, sr = librosa.load(RECORD_FILE, sr=SAMPLE_RATE, mono=True)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC, fmax=4000)  # Giới hạn tần số dưới 4kHz
-        if mfcc.shape[1] < MAX_LEN:
-            pad_width = MAX_LEN - mfcc.shape[1]
-            mfcc = np.pad(mfcc, ((0,0),(0,pad_width)), mode="constant")
-        else:
-            mfcc = mfcc[:, :MAX_LEN]
-        mfcc = mfcc[np.newaxis, ..., np.newaxis]  # shape (1,40,64,1)
-
-        for group in LABEL_GROUPS:
-            model = self.models[group]
-            if model is None:
-                self.result_vars[group].set("No model loaded")
-                continue
-            pred = model.predict(mfcc, verbose=0)
-            idx = np.argmax(pred)
-            label = self.label_maps[group].get(str(idx), f"Label {idx}")
-            self.result_vars[group].set(label)
+        y = read_wav(RECORD_FILE)
+        # = librosa.feature.mfcc(y, sr=SAMPLE_RATE, n_mfcc=N_MFCC, fmax=4000) với ma trận đã cache
+        db = 10.0 * np.log10(np.maximum(_MFCC_MEL_FB @ stft_power(y), 1e-10))
+        np.maximum(db, db.max() - 80.0, out=db)  # power_to_db(top_db=80)
+        feat = _DCT @ db
+        # pad 0 / truncate về MAX_LEN ngay trong buffer, shape (1,40,64,1)
+        mfcc = self._mfcc_buf
+        mfcc.fill(0.0)
+        w = min(feat.shape[1], MAX_LEN)
+        mfcc[0, :, :w, 0] = feat[:, :w]
+
+        self._show_predictions(mfcc)
 
         self._update_status("Prediction done")
 
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 import os
 import tkinter as tk
-from tkinter import filedialog, ttk
+from tkinter import ttk
 
 import numpy as np
-import sounddevice as sd
-import soundfile as sf
 import librosa
 import tensorflow as tf
+from audio_features import MEL_FB, N_FFT, HOP_LENGTH, WIN, read_wav, stft_power
+from model_runner import ModelRunnerMixin
+from stream_audio import StreamAudioMixin
 
 SAMPLE_RATE = 16000
 N_MFCC = 40   # số Mel filter (giữ tên cũ N_MFCC để tương thích)
@@ -17,18 +18,39 @@ RECORD_FILE = "temp_record.wav"
 
 LABEL_GROUPS = ["Action", "Device", "Room"]
 
-class VoiceTestGUI(tk.Tk):
+@tf.function(jit_compile=True)
+def _tf_mfe(y):
+    """MFE (1, N_MFCC, MAX_LEN, 1) trong một graph XLA, cùng kết quả với nhánh numpy"""
+    # WIN / MEL_FB của librosa: linear_to_mel_weight_matrix của TF là mel HTK, lệch với feature lúc train
+    yp = tf.pad(y, [[N_FFT // 2, N_FFT // 2]])
+    frames = tf.signal.frame(yp, N_FFT, HOP_LENGTH) * WIN
+    spec = tf.signal.rfft(frames)
+    power = tf.math.real(spec) ** 2 + tf.math.imag(spec) ** 2
+    mel = tf.matmul(power, MEL_FB.T)                       # (frames, N_MFCC)
+    db = 10.0 * tf.math.log(tf.maximum(mel, 1e-10)) / tf.math.log(10.0)
+    db = tf.maximum(db - tf.reduce_max(db), -80.0)          # power_to_db(ref=np.max, top_db=80)
+    db = db[:MAX_LEN]
+    db = tf.pad(db, [[0, MAX_LEN - tf.shape(db)[0]], [0, 0]])
+    return tf.reshape(tf.transpose(db), (1, N_MFCC, MAX_LEN, CHANNELS))
+
+class VoiceTestGUI(StreamAudioMixin, ModelRunnerMixin, tk.Tk):
+    record_file = RECORD_FILE
+    sample_rate = SAMPLE_RATE
+
     def __init__(self):
         super().__init__()
         self.title("Voice Test - MFE")
         self.geometry("600x450")
 
-        self.models = {name: None for name in LABEL_GROUPS}
-        self.label_maps = {name: {} for name in LABEL_GROUPS}
+        self._init_models(LABEL_GROUPS)
         self.result_vars = {name: tk.StringVar(value="") for name in LABEL_GROUPS}
 
         self.status_var = tk.StringVar(value="Ready")
 
+        # input (1,40,64,1) dùng lại giữa các lần predict
+        self._mfe_buf = np.zeros((1, N_MFCC, MAX_LEN, CHANNELS), dtype=np.float32)
+        self._tf_mfe_ok = True  # False khi _tf_mfe lỗi (không có XLA) -> tính bằng numpy
+
         self._build_ui()
 
     def _build_ui(self):
@@ -50,45 +72,11 @@ class VoiceTestGUI(tk.Tk):
         status_frame.pack(fill=tk.X, padx=10, pady=10)
         ttk.Label(status_frame, textvariable=self.status_var, foreground="blue").pack(side=tk.LEFT)
 
-    def _record(self):
-        duration = 2  # seconds
-        self._update_status(f"Recording for {duration} seconds...")
-        self.update_idletasks()
-        recording = sd.rec(int(duration*SAMPLE_RATE), samplerate=SAMPLE_RATE, channels=1)
-        sd.wait()
-        sf.write(RECORD_FILE, recording, SAMPLE_RATE)
-        self._update_status(f"Recording saved to {RECORD_FILE}")
-
-    def _play(self):
-        if not os.path.exists(RECORD_FILE):
-            self._update_status("No recording found")
-            return
-        data, sr = sf.read(RECORD_FILE)
-        self._update_status("Playing recording...")
-        self.update_idletasks()
-        sd.play(data, sr)
-        sd.wait()
-        self._update_status("Playback finished")
-
-    def _load_model(self, group_name):
-        path = filedialog.askopenfilename(filetypes=[("H5 files","*.h5")])
-        if not path:
-            self._update_status(f"Load model canceled for {group_name}")
-            return
-        try:
-            model = tf.keras.models.load_model(path)
-            self.models[group_name] = model
-            # load label map
-            label_file = path + "_labels.json"
-            if os.path.exists(label_file):
-                import json
-                with open(label_file, "r") as f:
-                    self.label_maps[group_name] = json.load(f)
-            self._update_status(f"{group_name} model loaded: {os.path.basename(path)}")
-        except Exception as e:
-            self._update_status(f"Error loading {group_name} model: {e}")
-
     def _predict(self):
+        if self._stream is not None:
+            # đang ghi/phát: temp_record.wav vẫn là bản ghi cũ
+            self._update_status("Audio device busy")
+            return
         if not os.path.exists(RECORD_FILE):
             self._update_status("No recording to predict")
             return
@@ -97,38 +85,28 @@ class VoiceTestGUI(tk.Tk):
         for group in LABEL_GROUPS:
             self.result_vars[group].set("")
 
-        y, sr = librosa.load(RECORD_FILE, sr=SAMPLE_RATE, mono=True)
-        # --- MFE (log-Mel Energy) ---
-        S = librosa.feature.melspectrogram(
-            y=y,
-            sr=sr,
-            n_mels=N_MFCC,
-            fmin=20,
-            fmax=4000,
-            power=2.0
-        )
-        mfe = librosa.power_to_db(S, ref=np.max)
-
-        if mfe.shape[1] < MAX_LEN:
-            pad_width = MAX_LEN - mfe.shape[1]
-            mfe = np.pad(mfe, ((0,0),(0,pad_width)), mode="constant")
-        else:
-            mfe = mfe[:, :MAX_LEN]
-
-        mfe = mfe[np.newaxis, ..., np.newaxis]  # shape (1,40,64,1)
-
-        for group in LABEL_GROUPS:
-            model = self.models[group]
-            if model is None:
-                self.result_vars[group].set("No model loaded")
-                continue
-            pred = model.predict(mfe, verbose=0)
-            idx = np.argmax(pred)
-            label = self.label_maps[group].get(str(idx), f"Label {idx}")
-            self.result_vars[group].set(label)
+        mfe = self._mfe(read_wav(RECORD_FILE))
+        self._show_predictions(mfe)
 
         self._update_status("Prediction done")
 
+    def _mfe(self, y):
+        """MFE (log-Mel Energy) shape (1,40,64,1): tensor từ _tf_mfe, lỗi thì tính bằng numpy"""
+        if self._tf_mfe_ok:
+            try:
+                return _tf_mfe(tf.constant(y))
+            except Exception:
+                self._tf_mfe_ok = False
+        S = MEL_FB @ stft_power(y)
+        db = librosa.power_to_db(S, ref=np.max)
+
+        # pad 0 / truncate về MAX_LEN ngay trong buffer, shape (1,40,64,1)
+        mfe = self._mfe_buf
+        mfe.fill(0.0)
+        w = min(db.shape[1], MAX_LEN)
+        mfe[0, :, :w, 0] = db[:, :w]
+        return mfe
+
     def _update_status(self, msg):
         self.status_var.set(msg)
         self.update_idletasks()
@@ -8,22 +8,27 @@ Voice Trainer with TensorFlow + Combo Box + MFE (Mel Filterbank Energy)
 """
 
 import os
+import gc
 import json
+import hashlib
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
 from tkinter import filedialog, ttk
 
 import numpy as np
-import librosa
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from sklearn.model_selection import train_test_split
-import tensorflow as tf
+from audio_features import MEL_FB, HOP_LENGTH, read_wav, stft_power
+# tensorflow import trong _build_model: process con (spawn) tính MFE không cần load TF
 
 SAMPLE_RATE = 16000
 N_MFCC = 40        # số filter của Mel
 MAX_LEN = 64       # số frame MFE tối đa (pad/truncate)
 CHANNELS = 1
+FEATURE_BATCH = 64 # số file tính STFT/Mel chung một lần
+CACHE_DIR = "cache" # MFE đã tính, theo hash danh sách file + mtime
 
 LABEL_GROUPS = {
     "Action": ["Bat", "Tat"],
@@ -31,6 +36,60 @@ LABEL_GROUPS = {
     "Room": ["Ngu", "Khach", "Bep"]
 }
 
+def _mfe_batch(ys):
+    """MFE (len(ys), N_MFCC, MAX_LEN, CHANNELS) cho cả batch, giống tính từng file"""
+    batch = np.zeros((len(ys), max(len(y) for y in ys)), dtype=np.float32)
+    for i, y in enumerate(ys):
+        batch[i, :len(y)] = y
+    # = melspectrogram(power=2.0) nhưng dùng filterbank đã cache
+    S = MEL_FB @ stft_power(batch)
+    out = np.zeros((len(ys), N_MFCC, MAX_LEN, CHANNELS), dtype=np.float32)
+    for i, y in enumerate(ys):
+        mfe = S[i, :, :1 + len(y) // HOP_LENGTH]
+        # power_to_db(ref=np.max) ghi đè lên S, không cấp phát mảng tạm
+        np.maximum(mfe, 1e-10, out=mfe)
+        np.log10(mfe, out=mfe)
+        mfe *= 10.0
+        mfe -= mfe.max()
+        np.maximum(mfe, -80.0, out=mfe)
+
+        # pad/truncate về MAX_LEN frame: ghi thẳng vào out (đã là 0)
+        w = min(mfe.shape[1], MAX_LEN)
+        out[i, :, :w, 0] = mfe[:, :w]
+    return out
+
+def _extract_batch(paths):
+    """Đọc + tính MFE cho một batch file trong process con -> (mfes, errors)"""
+    empty = np.empty((0, N_MFCC, MAX_LEN, CHANNELS), dtype=np.float32)
+    ys, errors = [], []
+    for path in paths:
+        try:
+            ys.append(read_wav(path))
+        except Exception as e:
+            errors.append(("Error loading", path, e))
+    if not ys:
+        return empty, errors
+    try:
+        return _mfe_batch(ys), errors
+    except Exception as e:
+        errors.append(("Error computing MFE", os.path.dirname(paths[0]), e))
+        return empty, errors
+
+def _make_tf_dataset(X, Y, idx, batch_size, shuffle):
+    """tf.data đọc từng batch từ X/Y (có thể là memmap) theo index, không copy X_train/X_test"""
+    import tensorflow as tf
+
+    def gen():
+        order = np.random.permutation(idx) if shuffle else idx
+        for b in range(0, len(order), batch_size):
+            sel = np.sort(order[b:b+batch_size])  # đọc memmap theo thứ tự tăng dần
+            yield X[sel].astype(np.float32), Y[sel].astype(np.int32)
+
+    ds = tf.data.Dataset.from_generator(gen, output_signature=(
+        tf.TensorSpec((None, N_MFCC, MAX_LEN, CHANNELS), tf.float32),
+        tf.TensorSpec((None,), tf.int32)))
+    return ds.prefetch(tf.data.AUTOTUNE)
+
 class VoiceTrainer(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -97,50 +156,76 @@ class VoiceTrainer(tk.Tk):
             self.dataset_dir.set(path)
 
     def _load_dataset(self, base_dir):
-        X, Y = [], []
         selected_labels = LABEL_GROUPS[self.model_type.get()]
         self.labels = selected_labels
         self._log("Selected labels:", selected_labels)
 
+        label_paths = []
         for idx, label in enumerate(selected_labels):
             folder = os.path.join(base_dir, label)
             if not os.path.exists(folder):
                 self._log("Folder not found:", folder)
                 continue
             files = [f for f in os.listdir(folder) if f.lower().endswith(".wav")]
-            for f in files:
-                path = os.path.join(folder, f)
-                try:
-                    y, sr = librosa.load(path, sr=SAMPLE_RATE, mono=True)
-                    # Compute Mel Filterbank Energy (MFE)
-                    S = librosa.feature.melspectrogram(
-                        y=y,
-                        sr=sr,
-                        n_mels=N_MFCC,
-                        fmin=20,
-                        fmax=4000,
-                        power=2.0  # energy
-                    )
-                    mfe = librosa.power_to_db(S, ref=np.max)
-
-                    # pad/truncate về MAX_LEN frame
-                    if mfe.shape[1] < MAX_LEN:
-                        pad_width = MAX_LEN - mfe.shape[1]
-                        mfe = np.pad(mfe, ((0,0),(0,pad_width)), mode="constant")
-                    else:
-                        mfe = mfe[:, :MAX_LEN]
-
-                    mfe = mfe[..., np.newaxis]  # add channel dimension
-                    X.append(mfe)
-                    Y.append(idx)
-                except Exception as e:
-                    self._log("Error loading", path, e)
-        X = np.array(X)
-        Y = np.array(Y)
+            label_paths.append((idx, [os.path.join(folder, f) for f in files]))
+
+        # dataset không đổi -> dùng lại MFE đã cache (memmap, không tính lại)
+        stamp = sorted((idx, p, os.path.getmtime(p)) for idx, paths in label_paths for p in paths)
+        key = hashlib.blake2b(repr((self.model_type.get(), N_MFCC, MAX_LEN, stamp)).encode()).hexdigest()[:16]
+        prefix = self.model_type.get() + "_"
+        x_path = os.path.join(CACHE_DIR, prefix + key + "_X.npy")
+        y_path = os.path.join(CACHE_DIR, prefix + key + "_Y.npy")
+        if os.path.exists(x_path) and os.path.exists(y_path):
+            X = np.load(x_path, mmap_mode="r")
+            Y = np.load(y_path, mmap_mode="r")
+            self._log("Loaded cached dataset:", X.shape, "labels:", len(selected_labels))
+            return X, Y
+
+        # chia batch theo từng label; ít file thì batch nhỏ lại để mọi core đều có việc
+        workers = os.cpu_count() or 1
+        total = sum(len(p) for _, p in label_paths)
+        size = max(1, min(FEATURE_BATCH, -(-total // workers)))
+        batches, batch_idx = [], []
+        for idx, paths in label_paths:
+            for b in range(0, len(paths), size):
+                batches.append(paths[b:b+size])
+                batch_idx.append(idx)
+
+        # Compute Mel Filterbank Energy (MFE) song song
+        ctx = multiprocessing.get_context("spawn")  # không fork process đang chạy TF
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as ex:
+            results = list(ex.map(_extract_batch, batches))
+
+        n = sum(len(mfes) for mfes, _ in results)
+        X = np.empty((n, N_MFCC, MAX_LEN, CHANNELS), dtype=np.float32)
+        Y = np.empty(n, dtype=np.int32)
+        k = 0
+        for idx, (mfes, errors) in zip(batch_idx, results):
+            for msg, where, e in errors:
+                self._log(msg, where, e)
+            X[k:k+len(mfes)] = mfes
+            Y[k:k+len(mfes)] = idx
+            k += len(mfes)
         self._log("Loaded dataset:", X.shape, "labels:", len(selected_labels))
+
+        # MFE nằm trong [-80, 0] dB -> float16 đủ chính xác, nửa dung lượng.
+        # Lần đầu cũng train trên bản float16 để kết quả giống các lần đọc từ cache.
+        X = X.astype(np.float16)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # cache cũ của cùng loại model (dataset đã đổi) không dùng lại nữa
+        with os.scandir(CACHE_DIR) as it:
+            for e in it:
+                if e.name.startswith(prefix) and e.name.endswith(".npy"):
+                    os.remove(e.path)
+        # ghi file tạm rồi os.replace: bị ngắt giữa chừng không để lại .npy hỏng; Y trước, X sau
+        for path, arr in ((y_path, Y), (x_path, X)):
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, arr)
+            os.replace(path + ".tmp", path)
         return X, Y
 
     def _build_model(self, input_shape, num_classes):
+        import tensorflow as tf
         model = tf.keras.models.Sequential([
             tf.keras.layers.Conv2D(32, (3,3), activation='relu', input_shape=input_shape),
             tf.keras.layers.MaxPooling2D((2,2)),
@@ -149,9 +234,12 @@ class VoiceTrainer(tk.Tk):
             tf.keras.layers.Flatten(),
             tf.keras.layers.Dense(128, activation='relu'),
             tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(num_classes, activation='softmax')
+            tf.keras.layers.Dense(num_classes, activation='softmax', dtype='float32')  # softmax/loss giữ FP32
         ])
-        model.compile(optimizer='adam',
+        optimizer = tf.keras.optimizers.Adam()
+        if tf.keras.mixed_precision.global_policy().name == 'mixed_float16':
+            optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+        model.compile(optimizer=optimizer,
                       loss='sparse_categorical_crossentropy',
                       metrics=['accuracy'])
         return model
@@ -160,29 +248,53 @@ class VoiceTrainer(tk.Tk):
         threading.Thread(target=self._train).start()
 
     def _train(self):
+        import tensorflow as tf
+        from sklearn.model_selection import train_test_split
         X, Y = self._load_dataset(self.dataset_dir.get())
         if len(X) == 0:
             self._log("Dataset is empty")
             return
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, Y, test_size=float(self.test_split.get()), random_state=42, stratify=Y)
+        # bỏ model / graph của lần train trước trước khi dựng model mới
+        self.model = None
+        self.history = None
+        gc.collect()
+        tf.keras.backend.clear_session()
+        # mixed precision chỉ có lợi trên GPU (tensor core); CPU giữ float32
+        policy = 'mixed_float16' if tf.config.list_physical_devices('GPU') else 'float32'
+        tf.keras.mixed_precision.set_global_policy(policy)
+        self._log("Precision policy:", policy)
+        idx_train, idx_test = train_test_split(
+            np.arange(len(Y)), test_size=float(self.test_split.get()), random_state=42, stratify=Y)
+        batch_size = int(self.batch_size.get())
+        train_ds = _make_tf_dataset(X, Y, idx_train, batch_size, shuffle=True)
+        val_ds = _make_tf_dataset(X, Y, idx_test, batch_size, shuffle=False)
 
         self.model = self._build_model((N_MFCC, MAX_LEN, CHANNELS), len(self.labels))
 
         self._log("Start training...")
         history = self.model.fit(
-            X_train, y_train,
+            train_ds,
             epochs=int(self.epochs.get()),
-            batch_size=int(self.batch_size.get()),
-            validation_data=(X_test, y_test),
+            validation_data=val_ds,
             verbose=0
         )
         self.history = history
+        if policy != 'float32':
+            # model float16 không convert được sang TFLite và chạy chậm trên máy test chỉ có CPU:
+            # dựng lại bản float32 (cho save / export / Save Model) rồi chép weight sang
+            tf.keras.mixed_precision.set_global_policy('float32')
+            model_f32 = self._build_model((N_MFCC, MAX_LEN, CHANNELS), len(self.labels))
+            model_f32.set_weights(self.model.get_weights())
+            self.model = model_f32
 
         self._update_chart(history)
         self._log("Training done. Val acc:", history.history['val_accuracy'][-1])
-        # Auto-save model
-        self._auto_save_model()
+        # Auto-save model (+ bản TFLite INT8, calibrate bằng một phần tập train)
+        rep_data = X[np.sort(idx_train[:200])].astype(np.float32)
+        # dataset + pipeline tf.data (giữ tham chiếu tới X) không cần nữa: giải phóng trước khi export
+        del X, Y, train_ds, val_ds
+        gc.collect()
+        self._auto_save_model(rep_data)
 
     def _update_chart(self, history):
         self.ax_loss.cla()
@@ -197,7 +309,7 @@ class VoiceTrainer(tk.Tk):
         self.ax_acc.legend()
         self.canvas.draw()
 
-    def _auto_save_model(self):
+    def _auto_save_model(self, rep_data=None):
         base_name = self.model_type.get()
         i = 1
         while os.path.exists(f"{base_name}_{i}.h5"):
@@ -208,6 +320,63 @@ class VoiceTrainer(tk.Tk):
         with open(path + "_labels.json", "w") as f:
             json.dump(labelmap, f)
         self._log("Model auto-saved to", path)
+        try:
+            self._export_saved_model(os.path.splitext(path)[0])
+        except Exception as e:
+            self._log("SavedModel export failed:", e)
+        try:
+            self._export_tflite_float(os.path.splitext(path)[0] + "_f32.tflite")
+        except Exception as e:
+            self._log("TFLite float export failed:", e)
+        if rep_data is not None and len(rep_data) > 0:
+            try:
+                self._export_tflite(os.path.splitext(path)[0] + ".tflite", rep_data)
+            except Exception as e:
+                self._log("TFLite export failed:", e)
+
+    def _serving_fn(self):
+        """Concrete function inference của self.model, input cố định (1, 40, 64, 1)."""
+        import tensorflow as tf
+        fn = tf.function(lambda x: self.model(x, training=False))
+        return fn.get_concrete_function(tf.TensorSpec([1, N_MFCC, MAX_LEN, CHANNELS], tf.float32, name="x"))
+
+    def _export_saved_model(self, path):
+        """Lưu SavedModel chỉ có weight + signature inference (không optimizer, không object Keras)."""
+        import tensorflow as tf
+        module = tf.Module()
+        module.model_variables = list(self.model.variables)  # không gồm slot của Adam
+        tf.saved_model.save(module, path, signatures={"serving_default": self._serving_fn()})
+        labelmap = {i: l for i,l in enumerate(self.labels)}
+        with open(path + "_labels.json", "w") as f:
+            json.dump(labelmap, f)
+        self._log("SavedModel saved to", path)
+
+    def _export_tflite(self, path, rep_data):
+        """Lưu model dạng TFLite full INT8 cho test_ver*."""
+        import tensorflow as tf
+        converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([x[np.newaxis].astype(np.float32)] for x in rep_data)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+        with open(path, "wb") as f:
+            f.write(converter.convert())
+        labelmap = {i: l for i,l in enumerate(self.labels)}
+        with open(path + "_labels.json", "w") as f:
+            json.dump(labelmap, f)
+        self._log("TFLite INT8 model saved to", path)
+
+    def _export_tflite_float(self, path):
+        """Lưu TFLite float32 từ concrete function shape cố định: graph tĩnh, không resize tensor."""
+        import tensorflow as tf
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([self._serving_fn()], self.model)
+        with open(path, "wb") as f:
+            f.write(converter.convert())
+        labelmap = {i: l for i,l in enumerate(self.labels)}
+        with open(path + "_labels.json", "w") as f:
+            json.dump(labelmap, f)
+        self._log("TFLite float model saved to", path)
 
     def _save_model(self):
         if self.model is None: